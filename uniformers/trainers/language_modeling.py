@@ -6,6 +6,7 @@ from textwrap import shorten
 
 from datasets import Features, Sequence, Value
 from datasets.fingerprint import update_fingerprint
+from torch import Tensor
 from transformers.data.data_collator import DataCollatorForLanguageModeling
 from transformers.trainer import Trainer
 from transformers.trainer_utils import get_last_checkpoint
@@ -212,4 +213,4 @@ class LMTrainer(Trainer):
 
     @cached_property
     def parameters(self):
-        return sum(t.numel() for t in self.model.parameters())
+        return sum(map(Tensor.numel, self.model.parameters()))
@@ -1,13 +1,17 @@
-from collections import ChainMap
-from functools import cached_property, partial
+from functools import cached_property, partialmethod
+from operator import itemgetter
+from os import makedirs
 from os.path import isdir, isfile, join
 from random import randrange
 
 from datasets import Value
-from datasets.load import load_metric
-from numpy import argmax, where, zeros
+from datasets.fingerprint import update_fingerprint
+from numpy import argmax, asarray, empty, flatnonzero, intp, unique, where, zeros
 from optuna.samplers import GridSampler
-from torch import Tensor, sigmoid
+from optuna.study import Study
+from sklearn.metrics import accuracy_score, precision_recall_fscore_support
+from sklearn.model_selection import ShuffleSplit, StratifiedShuffleSplit
+from torch import Tensor, cuda, sigmoid
 from transformers.models.auto.configuration_auto import AutoConfig
 from transformers.models.auto.modeling_auto import AutoModelForSequenceClassification
 from transformers.trainer import Trainer
@@ -23,14 +27,14 @@ logger = logging.get_logger("transformers")
 
 
 def _preprocess_data(examples, tokenizer, label_info):
-    if type(examples['text'][0]) == str:
+    texts, languages = examples['text'], examples['language']
+    if type(texts[0]) == str:
         logger.debug("Tokenizing single sentences.")
-        tokenized = tokenizer([clean_sentence(t, l) for t, l in zip(examples['text'], examples['language'])], truncation=True)
+        tokenized = tokenizer(list(map(clean_sentence, texts, languages)), truncation=True)
     else:
         logger.debug("Tokenizing sentence pairs.")
-        sentences1, sentences2, languages = *zip(*examples["text"]), examples['language']
-        sentences1 = [clean_sentence(s, l) for s, l in zip(sentences1, languages)]
-        sentences2 = [clean_sentence(s, l) for s, l in zip(sentences2, languages)]
+        sentences1 = list(map(clean_sentence, map(itemgetter(0), texts), languages))
+        sentences2 = list(map(clean_sentence, map(itemgetter(1), texts), languages))
         tokenized = tokenizer(sentences1, sentences2, truncation=True)
 
     if isinstance(examples["labels"][0], list):
@@ -51,28 +55,27 @@ class PoetryClassificationTrainer(Trainer):
         output_dir,
         task="meter",
         # https://github.com/huggingface/transformers/issues/14608#issuecomment-1004390803
-        fp16=True,
-        bf16=False,
-        tf32=False,
+        # defaults to bf16 and tf32 on supporting hardware and fp16 otherwise
+        fp16=None,
+        bf16=None,
+        tf32=None,
         overwrite_output_dir=False,
         # only change below stuff when model doesn't fit into memory (see
         # https://huggingface.co/docs/transformers/performance)
         gradient_accumulation_steps=1,
         gradient_checkpointing=False,
         test_run=False,
+        num_proc=None,
         **kwargs,
     ):
         assert task in ["meter", "rhyme", "emotion"]
+        if bf16 is None:
+            bf16 = not fp16 and cuda.is_available() and cuda.is_bf16_supported()
+        fp16 = not bf16 if fp16 is None else fp16
+        tf32 = bf16 if tf32 is None else tf32
+
         self.tokenizer = tokenizer
-        self.metrics = {
-            # FIXME: uses _compute instead of compute since the latter doesn't
-            # work with multi-label classification. should use sklearn directly
-            # instead
-            "precision": partial(load_metric("precision")._compute, average="macro", zero_division=0),
-            "recall": partial(load_metric("recall")._compute, average="macro", zero_division=0),
-            "f1": partial(load_metric("f1")._compute, average="macro"),
-            "accuracy": load_metric("accuracy")._compute
-        }
+        self._argmax_buf = None
 
         # interesting resource: https://huggingface.co/course/chapter7/6?fw=pt
         self.args = GlobalBatchTrainingArguments(
@@ -98,7 +101,8 @@ class PoetryClassificationTrainer(Trainer):
             output_dir=output_dir,
         )
 
-        train_dataset, eval_dataset, self.test_dataset = self.load_dataset(task)
+        train_dataset, eval_dataset, self.test_dataset = self.load_dataset(task, num_proc)
+        self.lang_test_datasets = self.split_languages(self.test_dataset)
 
         super().__init__(
             model_init=model_init,
@@ -117,10 +121,22 @@ class PoetryClassificationTrainer(Trainer):
             preds = zeros(probs.shape)
             preds[where(probs >= threshold)] = 1
         else:
-            preds = argmax(probs, axis=1)
-        return dict(ChainMap(*[func(predictions=preds, references=p.label_ids) for func in self.metrics.values()]))
+            # reuse buffer across evaluations to avoid reallocating predictions
+            if self._argmax_buf is None or len(self._argmax_buf) != len(probs):
+                self._argmax_buf = empty(len(probs), dtype=intp)
+            preds = argmax(probs, axis=1, out=self._argmax_buf)
 
-    def load_dataset(self, task):
+        precision, recall, f1, _ = precision_recall_fscore_support(
+            p.label_ids, preds, average="macro", zero_division=0
+        )
+        return {
+            "precision": precision,
+            "recall": recall,
+            "f1": f1,
+            "accuracy": accuracy_score(p.label_ids, preds),
+        }
+
+    def load_dataset(self, task, num_proc=None):
         self._num_samples = 0
         if task == "emotion":
             # FIXME: proper class option for single or multilingual training
@@ -128,9 +144,30 @@ class PoetryClassificationTrainer(Trainer):
         else:
             raw_dataset = load_dataset("poetrain", task, split="train")
 
+        # hash of the tokenizer is not the same across sessions so we use
+        # stable properties instead, which allows reusing the cache
+        new_fingerprint = update_fingerprint(
+            raw_dataset._fingerprint,  # pyright: ignore
+            _preprocess_data,
+            {
+                "task": task,
+                "tokenizer": self.tokenizer.name_or_path,
+                "vocab_size": len(self.tokenizer),
+                # affect output under truncation
+                "model_max_length": self.tokenizer.model_max_length,
+                "truncation_side": self.tokenizer.truncation_side,
+            },
+        )
+        # datasets doesn't create parent directories of cache files
+        makedirs(self.args.output_dir, exist_ok=True)
         tokenized_dataset = raw_dataset.map(
             _preprocess_data,
             batched=True,
+            batch_size=1000,
+            num_proc=num_proc,
+            new_fingerprint=new_fingerprint,  # pyright: ignore
+            cache_file_name=join(self.args.output_dir, f"tokenized-{new_fingerprint}.arrow"),
+            load_from_cache_file=True,
             #remove_columns=raw_dataset.column_names,  # pyright: ignore
             fn_kwargs = {  # pyright: ignore
                 "tokenizer": self.tokenizer,
@@ -143,31 +180,59 @@ class PoetryClassificationTrainer(Trainer):
             new_features['labels'].feature = Value("float64")
             tokenized_dataset = tokenized_dataset.cast(new_features)
 
-        train_dataset, tmp_dataset = tokenized_dataset.train_test_split( # pyright: ignore
-            test_size=0.1, stratify_by_column=None if task == "emotion" else "labels"
-        ).values()
-        eval_dataset, test_dataset = tmp_dataset.train_test_split(
-            test_size=0.5, stratify_by_column=None if task == "emotion" else "labels"
-        ).values()
+        # compute indices for all three splits first and materialize each split
+        # only once
+        labels = asarray(tokenized_dataset['labels']) # pyright: ignore
+        splitter = ShuffleSplit if task == "emotion" else StratifiedShuffleSplit
+        train_idx, tmp_idx = next(splitter(n_splits=1, test_size=0.1).split(labels, labels))
+        eval_idx, test_idx = next(splitter(n_splits=1, test_size=0.5).split(tmp_idx, labels[tmp_idx]))
+
+        train_dataset = tokenized_dataset.select(train_idx) # pyright: ignore
+        eval_dataset = tokenized_dataset.select(tmp_idx[eval_idx]) # pyright: ignore
+        test_dataset = tokenized_dataset.select(tmp_idx[test_idx]) # pyright: ignore
 
         index = randrange(len(train_dataset))
-        sample = train_dataset[index := randrange(len(train_dataset))]['input_ids'] # pyright: ignore
+        sample = train_dataset.with_format(columns=['input_ids'])[index]['input_ids'] # pyright: ignore
         detokenized = self.tokenizer.decode(sample)
         logger.info(f"Sample {index} of the training set: {sample}")
         logger.info(f"Sample {index} of the training set (detokenized): {detokenized}")
         return train_dataset, eval_dataset, test_dataset
 
+    def split_languages(self, ds):
+        lang_datasets = dict()
+        # partition by language with vectorized masks instead of a python
+        # predicate per row (as ds.filter would do)
+        if len(langs := unique(languages := asarray(ds['language']))) > 1:
+            for lang in langs:
+                lang_datasets[lang] = ds.select(flatnonzero(languages == lang))
+        return lang_datasets
+
     def grid_search(
-        self, search_space={"learning_rate": [1e-6, 5e-6, 1e-5, 5e-5, 1e-4]}
+        self,
+        search_space={"learning_rate": [1e-6, 5e-6, 1e-5, 5e-5, 1e-4]},
+        pruner=None,
+        n_jobs=1,
+        timeout=None,
+        gc_after_trial=True,
     ):
         sampler = GridSampler(search_space)
-        hp_space = lambda t: {k: t.suggest_float(k, min(v), max(v)) for k, v in search_space.items() }
-        best_run = self.hyperparameter_search(
-            direction="maximize",
-            hp_space=hp_space,
-            sampler=sampler,
-            compute_objective=lambda m: m["eval_f1"], # pyright: ignore
-        )
+        bounds = {k: (min(v), max(v)) for k, v in search_space.items()}
+        hp_space = lambda t: {k: t.suggest_float(k, low, high) for k, (low, high) in bounds.items()}
+        # transformers doesn't forward gc_after_trial to optuna, so we have to
+        # patch it in (otherwise memory of previous trials can lead to OOM)
+        optimize, Study.optimize = Study.optimize, partialmethod(Study.optimize, gc_after_trial=gc_after_trial)
+        try:
+            best_run = self.hyperparameter_search(
+                direction="maximize",
+                hp_space=hp_space,
+                sampler=sampler,
+                pruner=pruner,
+                n_jobs=n_jobs,
+                timeout=timeout,
+                compute_objective=lambda m: m["eval_f1"], # pyright: ignore
+            )
+        finally:
+            Study.optimize = optimize
         self._load_run(best_run)
 
     def train(self, **kwargs):
@@ -206,9 +271,8 @@ class PoetryClassificationTrainer(Trainer):
         all_metrics = self.evaluate(eval_dataset=ds)
 
         lang_metrics = dict()
-        if len(langs := sorted(set(ds['language']))) > 1:
-            for lang in langs:
-                lang_metrics[lang] = self.evaluate(eval_dataset=ds.filter(lambda example: example["language"] == lang))
+        for lang, lang_ds in self.lang_test_datasets.items():
+            lang_metrics[lang] = self.evaluate(eval_dataset=lang_ds)
 
         for name, metrics in zip(["test"] + [f"test-{l}" for l in lang_metrics.keys()], [all_metrics] + list(lang_metrics.values())):
             metrics = {key.replace("eval", "test"): value for key, value in metrics.items()}
@@ -219,4 +283,4 @@ class PoetryClassificationTrainer(Trainer):
     @cached_property
     def parameters(self):
         if hasattr(self, "model"):
-            return sum(t.numel() for t in self.model.parameters())
+            return sum(map(Tensor.numel, self.model.parameters()))
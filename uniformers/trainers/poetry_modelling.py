@@ -291,7 +291,7 @@ class AbstractPoetryLMTrainer(Trainer, ABC):
     @cached_property
     def parameters(self):
         if hasattr(self, "model"):
-            return sum(t.numel() for t in self.model.parameters())
+            return sum(map(Tensor.numel, self.model.parameters()))
         else:
             raise ValueError
 
@@ -316,6 +316,8 @@ class PoetryLMTrainer(AbstractPoetryLMTrainer):
             eval_multiplier=5 if test_run else 75,
             **kwargs,
         )
+        # tokenizer is patched once at this point, so mappings can be shared
+        self.p2t = Poetry2Tokens(self.tokenizer)
 
         if model.config.is_encoder_decoder:
             data_collator = DataCollatorForSeq2Seq(self.tokenizer, self.model)
@@ -354,7 +356,7 @@ class PoetryLMTrainer(AbstractPoetryLMTrainer):
 
     def compute_metrics(self, train_data, lang, medium, high, meter_model, rhyme_model, coherence_model, bs, p):
         preds = super().compute_metrics(p)
-        p2t = Poetry2Tokens(self.tokenizer)
+        p2t = self.p2t
         rhymes, meters, allits = list(), list(), list()
 
         for idx, pred in enumerate(preds):
@@ -417,7 +419,7 @@ class PoetryLMTrainer(AbstractPoetryLMTrainer):
             batched=True,
             fn_kwargs={  # pyright: ignore
                 "lang": lang,
-                "p2t": (p2t := Poetry2Tokens(self.tokenizer)),
+                "p2t": (p2t := self.p2t),
                 "is_encoder_decoder": self.model.config.is_encoder_decoder,
             },
         )
@@ -1,3 +1,5 @@
+from functools import lru_cache
+from re import compile, escape
 from string import punctuation
 from typing import List
 from collections.abc import Iterable
@@ -17,6 +19,24 @@ ENGLISH_SPECIFIC_APOSTROPHE = [
 NON_SPECIFIC_APOSTROPHE = r"\'", "'"  # pyright: ignore
 
 
+@lru_cache(maxsize=16)
+def _moses(lang: str):
+    # constructing Moses objects loads and compiles language resources, so
+    # only do it once per language
+    mpn = MosesPunctNormalizer(lang=lang)
+    mt = MosesTokenizer(lang=lang)
+    md = MosesDetokenizer(lang=lang)
+    mt.ENGLISH_SPECIFIC_APOSTROPHE = ENGLISH_SPECIFIC_APOSTROPHE
+    mt.NON_SPECIFIC_APOSTROPHE = NON_SPECIFIC_APOSTROPHE  # pyright: ignore
+    return mpn, mt, md
+
+
+@lru_cache(maxsize=16)
+def _non_punct(pct: str):
+    # matches any character which is not punctuation
+    return compile(f"[^{escape(pct)}]")
+
+
 def clean_sentence(
     sentence: str,
     lang: str,
@@ -24,17 +44,10 @@ def clean_sentence(
     protected: None | List[str] = None,
     detokenize: bool = True,
 ):
-    mpn = MosesPunctNormalizer(lang=lang)
-    md = MosesDetokenizer(lang=lang)
-    mt = MosesTokenizer(lang=lang)
-    mt.ENGLISH_SPECIFIC_APOSTROPHE = ENGLISH_SPECIFIC_APOSTROPHE
-    mt.NON_SPECIFIC_APOSTROPHE = NON_SPECIFIC_APOSTROPHE  # pyright: ignore
-
+    mpn, mt, md = _moses(lang)
     tokenized = mt.tokenize(mpn.normalize(sentence), protected_patterns=protected)
     if remove_punct:
-        pct = remove_punct if isinstance(remove_punct, Iterable) else punctuation
-        # remove punctuation https://stackoverflow.com/a/56847275
-        tokenized = list(
-            filter(lambda token: any(t not in pct for t in token), tokenized)
-        )
+        pct = "".join(remove_punct) if isinstance(remove_punct, Iterable) else punctuation
+        # remove tokens consisting only of punctuation
+        tokenized = list(filter(_non_punct(pct).search, tokenized))
     return md.detokenize(tokenized) if detokenize else tokenized